@@ -0,0 +1,24 @@
+# gunicorn.conf.py - Gunicorn configuration for the API service
+import multiprocessing
+import os
+import subprocess
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count()))
+
+# Cooperative workers: a request waiting on the ML service or Postgres
+# yields to other requests instead of holding a whole worker
+worker_class = 'gevent'
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 1000))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 60))
+
+def on_starting(server):
+    """Create missing tables once, before any worker imports the app"""
+    # A separate process keeps the app (and its DB pool) out of the master.
+    # create_all only adds missing tables and types, so this is safe on every start.
+    subprocess.run(['flask', '--app', 'app', 'create-tables'], check=False)
+
+def post_fork(server, worker):
+    """Make psycopg2 wait on sockets through gevent"""
+    from psycogreen.gevent import patch_psycopg
+    patch_psycopg()
@@ -0,0 +1,12 @@
+# gunicorn.ml.conf.py - Gunicorn configuration for the ML service
+import multiprocessing
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:4000')
+workers = int(os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count()))
+
+# Inference is CPU-bound NumPy/sklearn work that releases the GIL in places;
+# a few threads per worker keep cores busy while requests parse and serialize
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 120))
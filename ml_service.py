@@ -1,22 +1,30 @@
 # ml_service.py - Flask ML Service
 from flask import Flask, request, jsonify
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 import pandas as pd
 import numpy as np
-from datetime import datetime, timedelta
+from datetime import datetime
+from collections import OrderedDict
+import copy
+import hashlib
+from concurrent.futures import Future
 import joblib
+import orjson
+import os
+import queue
+import threading
+import time
 import warnings
 warnings.filterwarnings('ignore')
 
 # ML Libraries
-from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.feature_extraction.text import HashingVectorizer
 from sklearn.naive_bayes import MultinomialNB
-from sklearn.cluster import KMeans
 from sklearn.preprocessing import StandardScaler
 from sklearn.ensemble import IsolationForest
 import nltk
 from nltk.corpus import stopwords
-from nltk.tokenize import word_tokenize
 import re
 
 # Time Series
@@ -26,207 +34,420 @@ except ImportError:
     Prophet = None
     print("Prophet not installed. Time series forecasting will be limited.")
 
+class ORJSONProvider(DefaultJSONProvider):
+    """JSON provider that parses and serializes with orjson; also covers NumPy results"""
+    
+    option = orjson.OPT_NAIVE_UTC | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+    
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=self.option).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+    
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, default=self.default, option=self.option),
+            mimetype=self.mimetype
+        )
+
 app = Flask(__name__)
+app.json = ORJSONProvider(app)
 CORS(app)
 
 # Download NLTK data
 try:
-    nltk.download('punkt', quiet=True)
     nltk.download('stopwords', quiet=True)
 except:
     pass
 
+# Text preprocessing: words of 3+ letters, minus English stopwords
+TOKEN_RE = re.compile(r'[a-z]{3,}')
+try:
+    STOP_WORDS = frozenset(stopwords.words('english'))
+except LookupError:
+    STOP_WORDS = frozenset()
+
+def make_title_vectorizer():
+    """Stateless hashing vectorizer that lowercases, tokenizes and drops stopwords itself.
+
+    With no vocabulary to learn, a model can keep training on new titles via partial_fit.
+    """
+    return HashingVectorizer(
+        n_features=2 ** 11,
+        ngram_range=(1, 2),
+        alternate_sign=False,
+        norm='l2',
+        lowercase=True,
+        token_pattern=TOKEN_RE.pattern,
+        stop_words=list(STOP_WORDS) or None,
+        dtype=np.float32
+    )
+
+# Trained category models are saved here so a restart does not lose them
+MODEL_DIR = os.getenv('ML_MODEL_DIR', 'ml_models')
+MODEL_ID_RE = re.compile(r'[A-Za-z0-9_-]{1,64}')
+
+TRANSACTION_COLUMNS = ['date', 'amount', 'category', 'paymentMode', 'title']
+
+def transactions_frame(transactions_data):
+    """Build a transactions DataFrame with fixed columns and dtypes; dates are parsed by ensure_datetime"""
+    df = pd.DataFrame.from_records(transactions_data, columns=TRANSACTION_COLUMNS)
+    df['amount'] = pd.to_numeric(df['amount'], errors='coerce').astype(np.float64)
+    df['category'] = df['category'].astype('category')
+    return df
+
+def ensure_datetime(df):
+    """Parse df['date'] as ISO 8601 in place, as naive UTC, unless it already is naive datetime64"""
+    dates = df['date']
+    if not pd.api.types.is_datetime64_dtype(dates) or isinstance(dates.dtype, pd.DatetimeTZDtype):
+        # Offsets such as a trailing 'Z' give tz-aware values, which numpy datetime64 casts reject
+        df['date'] = pd.to_datetime(dates, format='ISO8601', utc=True, cache=True).dt.tz_localize(None)
+    return df['date']
+
+def array_digest(*arrays):
+    """Hash of numpy arrays' dtype, shape and contents, for cache keys"""
+    digest = hashlib.blake2b(digest_size=16)
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        digest.update(f'{array.dtype}{array.shape}'.encode())
+        digest.update(array.tobytes())
+    return digest.hexdigest()
+
 class ExpenseMLService:
+    # Maximum number of per-user category models kept in memory
+    MAX_CACHED_CATEGORY_MODELS = 256
+    # Fitted Prophet models are reused for an unchanged daily series
+    MAX_CACHED_PROPHET_MODELS = 128
+    PROPHET_MODEL_TTL = 3600
+    # Fitted (scaler, detector) pairs reused for an unchanged daily feature matrix
+    MAX_CACHED_ANOMALY_DETECTORS = 256
+
     def __init__(self):
         self.category_model = None
         self.category_vectorizer = None
-        self.anomaly_detector = None
-        self.scaler = StandardScaler()
-        self.cluster_model = None
-        
-    def preprocess_text(self, text):
-        """Preprocess text for NLP"""
-        if not text:
-            return ""
-        
-        # Convert to lowercase and remove special characters
-        text = re.sub(r'[^a-zA-Z\s]', '', text.lower())
-        
-        # Tokenize
+        self.category_models = OrderedDict()  # model_id -> (vectorizer, model)
+        self.prophet_models = OrderedDict()  # series key -> (fitted_at, model)
+        self.anomaly_detectors = OrderedDict()  # feature key -> (scaler, detector)
+        # Guards the LRUs above; request threads and the batcher share them
+        self.cache_lock = threading.Lock()
+        
+        fitted = self.load_category_model()
+        if fitted:
+            self.category_vectorizer, self.category_model = fitted
+    
+    def category_model_path(self, model_id=None):
+        """File for a category model, or None if the id is not a safe file name"""
+        if model_id is None:
+            return os.path.join(MODEL_DIR, 'category_model.joblib')
+        if not MODEL_ID_RE.fullmatch(model_id):
+            return None
+        return os.path.join(MODEL_DIR, f'category_model_{model_id}.joblib')
+    
+    def save_category_model(self, fitted, model_id=None):
+        """Write a (vectorizer, model) pair to disk; failures only cost the warm start"""
+        path = self.category_model_path(model_id)
+        if not path:
+            return
         try:
-            tokens = word_tokenize(text)
-            # Remove stopwords
-            stop_words = set(stopwords.words('english'))
-            tokens = [token for token in tokens if token not in stop_words and len(token) > 2]
-            return ' '.join(tokens)
-        except:
-            return text.lower()
+            os.makedirs(MODEL_DIR, exist_ok=True)
+            tmp_path = f'{path}.tmp'
+            joblib.dump(fitted, tmp_path, compress=3)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Could not save category model: {e}")
     
-    def train_category_model(self, transactions_data):
-        """Train expense category prediction model"""
+    def delete_category_model(self, model_id):
+        """Remove a per-user model from memory and disk"""
+        with self.cache_lock:
+            self.category_models.pop(model_id, None)
+        path = self.category_model_path(model_id)
+        if not path:
+            return
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"Could not delete category model: {e}")
+    
+    def load_category_model(self, model_id=None):
+        """Read a saved (vectorizer, model) pair, or None if there is none"""
+        path = self.category_model_path(model_id)
+        if not path:
+            return None
+        try:
+            return joblib.load(path)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Could not load category model: {e}")
+            return None
+        
+    def fit_category_model(self, transactions_data, previous=None):
+        """Fit a (vectorizer, model) pair for category prediction.
+
+        With a previous pair, its model is copied and updated with partial_fit, unless the
+        data brings a category the model has never seen; then a fresh model is fit.
+        """
         df = pd.DataFrame(transactions_data)
         
         if df.empty or 'title' not in df.columns or 'category' not in df.columns:
-            return False
+            return None
             
-        # Preprocess titles
-        df['processed_title'] = df['title'].apply(self.preprocess_text)
-        df = df[df['processed_title'].str.len() > 0]
-        
-        if len(df) < 5:  # Need minimum data
-            return False
+        # Vectorize raw titles; rows without any usable token are dropped
+        vectorizer = previous[0] if previous else make_title_vectorizer()
+        X = vectorizer.transform(df['title'].fillna('').astype(str))
+        has_tokens = X.getnnz(axis=1) > 0
+        X = X[has_tokens]
+        y = df['category'].to_numpy()[has_tokens]
+        
+        if previous and len(y) and np.isin(y, previous[1].classes_).all():
+            model = copy.deepcopy(previous[1])  # predictions may be reading the live model
+            model.partial_fit(X, y)
+            return vectorizer, model
+        
+        if X.shape[0] < 5:  # Need minimum data
+            return None
             
         # Train model
-        self.category_vectorizer = TfidfVectorizer(max_features=100, ngram_range=(1, 2))
-        X = self.category_vectorizer.fit_transform(df['processed_title'])
-        y = df['category']
+        model = MultinomialNB()
+        model.partial_fit(X, y, classes=np.unique(y))
+        
+        return vectorizer, model
+    
+    def train_category_model(self, transactions_data, model_id=None, incremental=False, replaces=None):
+        """Train expense category prediction model, optionally updating the existing one.
+
+        replaces names a per-user model this one supersedes; it is deleted
+        after the new model is saved so old generations do not pile up.
+        """
+        previous = self.get_category_model(model_id) if incremental else None
+        fitted = self.fit_category_model(transactions_data, previous)
+        if not fitted:
+            return False
         
-        self.category_model = MultinomialNB()
-        self.category_model.fit(X, y)
+        if model_id is None:
+            self.category_vectorizer, self.category_model = fitted
+        else:
+            self.cache_category_model(model_id, fitted)
         
+        self.save_category_model(fitted, model_id)
+        if replaces and replaces != model_id:
+            self.delete_category_model(replaces)
         return True
     
-    def predict_category(self, title):
-        """Predict category for a transaction title"""
-        if not self.category_model or not self.category_vectorizer:
-            return None
-            
-        processed_title = self.preprocess_text(title)
-        if not processed_title:
-            return None
-            
-        X = self.category_vectorizer.transform([processed_title])
-        prediction = self.category_model.predict(X)[0]
-        probability = max(self.category_model.predict_proba(X)[0])
+    def cache_category_model(self, model_id, fitted):
+        """Keep a per-user model in the in-memory LRU"""
+        with self.cache_lock:
+            self.category_models[model_id] = fitted
+            self.category_models.move_to_end(model_id)
+            while len(self.category_models) > self.MAX_CACHED_CATEGORY_MODELS:
+                self.category_models.popitem(last=False)
+    
+    def get_category_model(self, model_id=None):
+        """Get the (vectorizer, model) pair for a model id, or the default model"""
+        if model_id is None:
+            if not self.category_model or not self.category_vectorizer:
+                return None
+            return self.category_vectorizer, self.category_model
+        
+        with self.cache_lock:
+            fitted = self.category_models.get(model_id)
+            if fitted:
+                self.category_models.move_to_end(model_id)
+                return fitted
+        
+        # Evicted or trained before a restart
+        fitted = self.load_category_model(model_id)
+        if fitted:
+            self.cache_category_model(model_id, fitted)
+        return fitted
+    
+    def predict_categories(self, titles, model_id=None):
+        """Predict categories for a batch of transaction titles"""
+        fitted = self.get_category_model(model_id)
+        if not fitted:
+            return [None] * len(titles)
+        vectorizer, model = fitted
+        
+        results = [None] * len(titles)
+        
+        # Vectorize all titles in one pass; titles with no known token get no prediction
+        X = vectorizer.transform([title or '' for title in titles])
+        valid = np.flatnonzero(X.getnnz(axis=1))
+        if not len(valid):
+            return results
+        
+        # One predict_proba pass gives both the class and its confidence
+        probabilities = model.predict_proba(X[valid])
+        best = probabilities.argmax(axis=1)
+        predictions = model.classes_[best]
+        probabilities = probabilities[np.arange(len(best)), best]
+        
+        for i, prediction, probability in zip(valid, predictions, probabilities):
+            results[i] = {
+                'predicted_category': prediction,
+                'confidence': float(probability)
+            }
         
-        return {
-            'predicted_category': prediction,
-            'confidence': float(probability)
-        }
+        return results
+    
+    def predict_category(self, title, model_id=None):
+        """Predict category for a transaction title"""
+        return self.predict_categories([title], model_id)[0]
     
-    def detect_anomalies(self, transactions_data):
+    def get_anomaly_detector(self, features, user_id=None):
+        """Fit a scaler and IsolationForest, or reuse the pair fitted on the same features"""
+        key = (user_id, array_digest(features))
+        with self.cache_lock:
+            cached = self.anomaly_detectors.get(key)
+            if cached:
+                self.anomaly_detectors.move_to_end(key)
+                return cached
+        
+        scaler = StandardScaler().fit(features)
+        # Default tree count and single-threaded: the fit is cached per feature digest,
+        # and n_jobs=-1 would oversubscribe cores under gthread workers
+        detector = IsolationForest(contamination=0.1, random_state=42)
+        detector.fit(scaler.transform(features))
+        
+        with self.cache_lock:
+            self.anomaly_detectors[key] = (scaler, detector)
+            while len(self.anomaly_detectors) > self.MAX_CACHED_ANOMALY_DETECTORS:
+                self.anomaly_detectors.popitem(last=False)
+        return scaler, detector
+    
+    def detect_anomalies(self, transactions_data, user_id=None):
         """Detect anomalous spending behavior"""
-        df = pd.DataFrame(transactions_data)
+        df = transactions_frame(transactions_data)
         
         if df.empty or len(df) < 10:
             return []
             
-        # Create features for anomaly detection
-        df['date'] = pd.to_datetime(df['date'])
-        df['day_of_week'] = df['date'].dt.dayofweek
-        df['hour'] = df['date'].dt.hour
-        df['month'] = df['date'].dt.month
-        
-        # Aggregate by day
-        daily_spending = df.groupby(df['date'].dt.date).agg({
-            'amount': ['sum', 'count', 'mean', 'std']
-        }).fillna(0)
-        daily_spending.columns = ['total_amount', 'transaction_count', 'avg_amount', 'std_amount']
-        
-        if len(daily_spending) < 7:
+        # Aggregate by day on sorted day numbers
+        days = ensure_datetime(df).to_numpy().astype('datetime64[D]')
+        order = np.argsort(days, kind='stable')
+        days = days[order]
+        amounts = df['amount'].to_numpy(dtype=np.float64)[order]
+        
+        unique_days, starts, counts = np.unique(days, return_index=True, return_counts=True)
+        if len(unique_days) < 7:
             return []
-            
-        # Fit anomaly detector
-        self.anomaly_detector = IsolationForest(contamination=0.1, random_state=42)
-        features = daily_spending[['total_amount', 'transaction_count', 'avg_amount']].values
         
-        # Scale features
-        features_scaled = self.scaler.fit_transform(features)
-        anomalies = self.anomaly_detector.fit_predict(features_scaled)
+        totals = np.add.reduceat(amounts, starts)
+        averages = totals / counts
+        # C-contiguous float32, the layout and dtype IsolationForest works in, so sklearn does not copy
+        features = np.ascontiguousarray(np.column_stack((totals, counts, averages)), dtype=np.float32)
+            
+        # Fit (or reuse) the detector and score each day
+        scaler, detector = self.get_anomaly_detector(features, user_id)
+        anomalies = detector.predict(scaler.transform(features))
         
         # Get anomalous days
-        anomaly_dates = daily_spending.index[anomalies == -1].tolist()
-        
-        results = []
-        for date in anomaly_dates:
-            day_data = daily_spending.loc[date]
-            results.append({
-                'date': str(date),
-                'total_spent': float(day_data['total_amount']),
-                'transaction_count': int(day_data['transaction_count']),
-                'avg_amount': float(day_data['avg_amount']),
-                'anomaly_score': 'High' if day_data['total_amount'] > daily_spending['total_amount'].quantile(0.9) else 'Medium'
-            })
-        
-        return results
+        high_threshold = np.quantile(totals, 0.9)
+        return [
+            {
+                'date': str(unique_days[i]),
+                'total_spent': float(totals[i]),
+                'transaction_count': int(counts[i]),
+                'avg_amount': float(averages[i]),
+                'anomaly_score': 'High' if totals[i] > high_threshold else 'Medium'
+            }
+            for i in np.flatnonzero(anomalies == -1)
+        ]
     
     def cluster_spending_habits(self, transactions_data):
         """Cluster users based on spending patterns"""
-        df = pd.DataFrame(transactions_data)
+        df = transactions_frame(transactions_data)
         
         if df.empty or len(df) < 20:
             return None
             
-        df['date'] = pd.to_datetime(df['date'])
+        # Extract columns once; every statistic below reads these arrays
+        amounts = df['amount'].to_numpy(dtype=np.float64)
+        dates = ensure_datetime(df).to_numpy()
+        mean_amount, std_amount, total_spending = amounts.mean(), amounts.std(ddof=1), amounts.sum()
         
         # Create spending pattern features
-        category_spending = df.groupby('category')['amount'].sum()
-        payment_mode_usage = df['paymentMode'].value_counts(normalize=True)
-        
-        # Time-based patterns
-        hourly_spending = df.groupby(df['date'].dt.hour)['amount'].mean()
-        daily_spending = df.groupby(df['date'].dt.dayofweek)['amount'].mean()
+        category_spending = df.groupby('category', sort=False, observed=True)['amount'].sum()
+        payment_mode_usage = df['paymentMode'].value_counts(normalize=True, sort=False)
         
         # Create feature vector
         features = []
         
         # Top categories spending ratios
-        top_categories = category_spending.nlargest(5).index
-        total_spending = df['amount'].sum()
-        for cat in top_categories:
-            ratio = category_spending.get(cat, 0) / total_spending
-            features.append(ratio)
+        features.extend(category_spending.nlargest(5).to_numpy() / total_spending)
         
         # Payment mode preferences
         for mode in ['cash', 'card', 'wallet', 'bank']:
             features.append(payment_mode_usage.get(mode, 0))
         
         # Time patterns
+        active_days = (dates.max() - dates.min()) // np.timedelta64(1, 'D') + 1
         features.extend([
-            df['amount'].mean(),  # Average transaction
-            df['amount'].std(),   # Spending volatility
-            len(df) / ((df['date'].max() - df['date'].min()).days + 1),  # Transaction frequency
+            mean_amount,  # Average transaction
+            std_amount,   # Spending volatility
+            len(amounts) / active_days,  # Transaction frequency
         ])
         
         # Simple clustering (would normally use multiple users' data)
         return {
-            'spending_profile': 'High Spender' if df['amount'].mean() > 1000 else 'Moderate Spender' if df['amount'].mean() > 500 else 'Conservative Spender',
+            'spending_profile': 'High Spender' if mean_amount > 1000 else 'Moderate Spender' if mean_amount > 500 else 'Conservative Spender',
             'primary_category': category_spending.idxmax(),
             'preferred_payment': payment_mode_usage.idxmax(),
-            'spending_pattern': 'Consistent' if df['amount'].std() < df['amount'].mean() * 0.5 else 'Variable'
+            'spending_pattern': 'Consistent' if std_amount < mean_amount * 0.5 else 'Variable'
         }
     
-    def forecast_expenses(self, transactions_data, days_ahead=30):
+    def get_prophet_model(self, daily_spending, user_id=None):
+        """Fit a Prophet model, or reuse one fitted on the same daily series"""
+        key = (user_id, array_digest(daily_spending['ds'].to_numpy(), daily_spending['y'].to_numpy()))
+        now = time.monotonic()
+        
+        with self.cache_lock:
+            cached = self.prophet_models.get(key)
+            if cached and now - cached[0] < self.PROPHET_MODEL_TTL:
+                self.prophet_models.move_to_end(key)
+                return cached[1]
+        
+        model = Prophet(daily_seasonality=False, weekly_seasonality=True)
+        model.fit(daily_spending)
+        
+        with self.cache_lock:
+            self.prophet_models[key] = (now, model)
+            self.prophet_models.move_to_end(key)
+            while len(self.prophet_models) > self.MAX_CACHED_PROPHET_MODELS:
+                self.prophet_models.popitem(last=False)
+        return model
+    
+    def forecast_dates(self, last_date, days_ahead):
+        """ISO dates for the days following last_date"""
+        return pd.date_range(last_date + pd.Timedelta(days=1), periods=days_ahead).strftime('%Y-%m-%d').tolist()
+    
+    def forecast_expenses(self, transactions_data, days_ahead=30, user_id=None):
         """Forecast future expenses"""
-        df = pd.DataFrame(transactions_data)
+        df = transactions_frame(transactions_data)
         
         if df.empty or len(df) < 30:
             return None
             
-        df['date'] = pd.to_datetime(df['date'])
+        ensure_datetime(df)
         
-        # Aggregate daily spending
-        daily_spending = df.groupby(df['date'].dt.date)['amount'].sum().reset_index()
+        # Aggregate daily spending; keys stay datetime64 and sorted, which the trend math relies on
+        daily_spending = df.groupby(df['date'].dt.normalize())['amount'].sum().reset_index()
         daily_spending.columns = ['ds', 'y']
-        daily_spending['ds'] = pd.to_datetime(daily_spending['ds'])
         
         if len(daily_spending) < 14:
             # Simple linear trend for limited data
             recent_avg = daily_spending['y'].tail(7).mean()
             trend = (daily_spending['y'].tail(7).mean() - daily_spending['y'].head(7).mean()) / len(daily_spending)
             
-            forecast_dates = []
-            forecast_values = []
-            
-            last_date = daily_spending['ds'].max()
-            for i in range(1, days_ahead + 1):
-                forecast_date = last_date + timedelta(days=i)
-                forecast_value = max(0, recent_avg + (trend * i))
-                forecast_dates.append(forecast_date.strftime('%Y-%m-%d'))
-                forecast_values.append(float(forecast_value))
+            steps = np.arange(1, days_ahead + 1, dtype=np.float64)
+            forecast_values = np.maximum(0.0, recent_avg + trend * steps).tolist()
             
             return {
-                'forecast_dates': forecast_dates,
+                'forecast_dates': self.forecast_dates(daily_spending['ds'].max(), days_ahead),
                 'forecast_values': forecast_values,
                 'total_forecast': sum(forecast_values),
                 'method': 'linear_trend'
@@ -235,8 +456,7 @@ class ExpenseMLService:
         # Use Prophet if available
         if Prophet:
             try:
-                model = Prophet(daily_seasonality=False, weekly_seasonality=True)
-                model.fit(daily_spending)
+                model = self.get_prophet_model(daily_spending, user_id)
                 
                 future = model.make_future_dataframe(periods=days_ahead)
                 forecast = model.predict(future)
@@ -246,7 +466,7 @@ class ExpenseMLService:
                 
                 return {
                     'forecast_dates': future_forecast['ds'].dt.strftime('%Y-%m-%d').tolist(),
-                    'forecast_values': [max(0, float(x)) for x in future_forecast['yhat'].tolist()],
+                    'forecast_values': np.maximum(future_forecast['yhat'].to_numpy(), 0.0).tolist(),
                     'total_forecast': float(future_forecast['yhat'].sum()),
                     'method': 'prophet'
                 }
@@ -257,37 +477,32 @@ class ExpenseMLService:
         window = min(7, len(daily_spending))
         recent_avg = daily_spending['y'].tail(window).mean()
         
-        forecast_dates = []
-        forecast_values = []
-        
-        last_date = daily_spending['ds'].max()
-        for i in range(1, days_ahead + 1):
-            forecast_date = last_date + timedelta(days=i)
-            forecast_dates.append(forecast_date.strftime('%Y-%m-%d'))
-            forecast_values.append(float(recent_avg))
-        
         return {
-            'forecast_dates': forecast_dates,
-            'forecast_values': forecast_values,
+            'forecast_dates': self.forecast_dates(daily_spending['ds'].max(), days_ahead),
+            'forecast_values': [float(recent_avg)] * days_ahead,
             'total_forecast': float(recent_avg * days_ahead),
             'method': 'moving_average'
         }
     
     def get_recommendations(self, transactions_data, budget_info=None):
         """Generate budget optimization recommendations"""
-        df = pd.DataFrame(transactions_data)
+        df = transactions_frame(transactions_data)
         
         if df.empty:
             return []
             
-        df['date'] = pd.to_datetime(df['date'])
-        current_month = df['date'].dt.to_period('M').max()
-        monthly_data = df[df['date'].dt.to_period('M') == current_month]
+        ensure_datetime(df)
+        
+        # Latest month in the data, selected with two datetime comparisons
+        latest = df['date'].max()
+        month_start = pd.Timestamp(latest.year, latest.month, 1)
+        next_month_start = month_start + pd.offsets.MonthBegin(1)
+        monthly_data = df[(df['date'] >= month_start) & (df['date'] < next_month_start)]
         
         recommendations = []
         
         # Category analysis
-        category_spending = monthly_data.groupby('category')['amount'].sum().sort_values(ascending=False)
+        category_spending = monthly_data.groupby('category', sort=False, observed=True)['amount'].sum().sort_values(ascending=False)
         total_spent = category_spending.sum()
         
         # High spending categories
@@ -302,22 +517,26 @@ class ExpenseMLService:
                     'priority': 'high'
                 })
         
+        # Shared column arrays and masks for the remaining checks
+        amounts = monthly_data['amount'].to_numpy()
+        weekend = monthly_data['date'].dt.dayofweek.to_numpy() >= 5
+        small = amounts < 50
+        
         # Frequent small transactions
-        small_transactions = monthly_data[monthly_data['amount'] < 50]
-        if len(small_transactions) > 20:
-            total_small = small_transactions['amount'].sum()
+        small_count = int(small.sum())
+        if small_count > 20:
+            total_small = amounts[small].sum()
             recommendations.append({
                 'type': 'small_transactions',
-                'message': f"You made {len(small_transactions)} small transactions totaling ${total_small:.2f}. Consider consolidating purchases.",
+                'message': f"You made {small_count} small transactions totaling ${total_small:.2f}. Consider consolidating purchases.",
                 'amount': float(total_small),
                 'priority': 'medium'
             })
         
         # Weekend spending
-        weekend_data = monthly_data[monthly_data['date'].dt.dayofweek >= 5]
-        if not weekend_data.empty:
-            weekend_avg = weekend_data['amount'].mean()
-            weekday_avg = monthly_data[monthly_data['date'].dt.dayofweek < 5]['amount'].mean()
+        if weekend.any():
+            weekend_avg = amounts[weekend].mean()
+            weekday_avg = amounts[~weekend].mean() if not weekend.all() else np.nan
             
             if weekend_avg > weekday_avg * 1.5:
                 recommendations.append({
@@ -330,7 +549,8 @@ class ExpenseMLService:
         if budget_info:
             budget = budget_info.get('monthly_budget', 0)
             if budget > 0 and total_spent > budget * 0.8:
-                days_left = (current_month.end_time - datetime.now()).days
+                month_end = next_month_start - pd.Timedelta(1, 'ns')
+                days_left = (month_end - datetime.now()).days
                 daily_budget_left = (budget - total_spent) / max(days_left, 1)
                 
                 recommendations.append({
@@ -354,7 +574,10 @@ def train_category_model():
         data = request.json
         transactions = data.get('transactions', [])
         
-        success = ml_service.train_category_model(transactions)
+        success = ml_service.train_category_model(
+            transactions, data.get('model_id'), bool(data.get('incremental')),
+            data.get('replaces')
+        )
         
         return jsonify({
             'success': success,
@@ -363,13 +586,70 @@ def train_category_model():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+class CategoryPredictionBatcher:
+    """Score concurrent single-title predictions together in one transform/predict_proba call"""
+
+    def __init__(self, service, batch_size=64, batch_timeout_ms=10):
+        self.service = service
+        self.batch_size = batch_size
+        self.batch_timeout = batch_timeout_ms / 1000.0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker = None
+
+    def submit(self, title, model_id=None):
+        """Queue a title for prediction and return a Future for its result"""
+        future = Future()
+        self._ensure_worker()
+        self._queue.put((title, model_id, future))
+        return future
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.batch_timeout
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._predict(batch)
+
+    def _predict(self, batch):
+        groups = OrderedDict()
+        for item in batch:
+            groups.setdefault(item[1], []).append(item)
+        
+        for model_id, items in groups.items():
+            try:
+                predictions = self.service.predict_categories([title for title, _, _ in items], model_id)
+            except Exception as e:
+                for _, _, future in items:
+                    future.set_exception(e)
+                continue
+            for (_, _, future), prediction in zip(items, predictions):
+                future.set_result(prediction)
+
+category_batcher = CategoryPredictionBatcher(ml_service)
+
 @app.route('/predict_category', methods=['POST'])
 def predict_category():
     try:
         data = request.json
         title = data.get('title', '')
         
-        prediction = ml_service.predict_category(title)
+        prediction = category_batcher.submit(title, data.get('model_id')).result(timeout=30)
         
         if prediction:
             return jsonify(prediction)
@@ -379,13 +659,42 @@ def predict_category():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/predict_category_batch', methods=['POST'])
+def predict_category_batch():
+    try:
+        data = request.json
+        batch = data.get('batch', [])
+        
+        # Group titles by model so each model scores its titles in one call
+        groups = OrderedDict()
+        for i, item in enumerate(batch):
+            groups.setdefault(item.get('model_id'), []).append(i)
+        
+        results = [{'success': False}] * len(batch)
+        for model_id, indexes in groups.items():
+            # Callers retrain on a missing model, but not on a title with no usable tokens
+            if ml_service.get_category_model(model_id) is None:
+                for i in indexes:
+                    results[i] = {'success': False, 'error': 'model_not_found'}
+                continue
+            predictions = ml_service.predict_categories(
+                [batch[i].get('title', '') for i in indexes], model_id
+            )
+            for i, prediction in zip(indexes, predictions):
+                if prediction:
+                    results[i] = dict(prediction, success=True)
+        
+        return jsonify({'results': results, 'count': len(results)})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/detect_anomalies', methods=['POST'])
 def detect_anomalies():
     try:
         data = request.json
         transactions = data.get('transactions', [])
         
-        anomalies = ml_service.detect_anomalies(transactions)
+        anomalies = ml_service.detect_anomalies(transactions, data.get('user_id'))
         
         return jsonify({
             'anomalies': anomalies,
@@ -412,8 +721,9 @@ def forecast_expenses():
         data = request.json
         transactions = data.get('transactions', [])
         days_ahead = data.get('days_ahead', 30)
+        user_id = data.get('user_id')
         
-        forecast = ml_service.forecast_expenses(transactions, days_ahead)
+        forecast = ml_service.forecast_expenses(transactions, days_ahead, user_id)
         
         return jsonify(forecast or {'error': 'Insufficient data for forecasting'})
     except Exception as e:
@@ -440,8 +750,10 @@ if __name__ == '__main__':
     print("Endpoints available:")
     print("- POST /train_category_model")
     print("- POST /predict_category")
+    print("- POST /predict_category_batch")
     print("- POST /detect_anomalies")
     print("- POST /analyze_spending_habits")
     print("- POST /forecast_expenses")
     print("- POST /get_recommendations")
-    app.run(debug=True, host='0.0.0.0', port=4000)
\ No newline at end of file
+    # Development only; production runs under gunicorn with gunicorn.ml.conf.py
+    app.run(debug=os.getenv('FLASK_ENV') == 'development', host='0.0.0.0', port=4000, threaded=True)
\ No newline at end of file
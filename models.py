@@ -1,11 +1,122 @@
 # models.py - Database Models
 from datetime import datetime
+import os
+import uuid
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
-import json
+from sqlalchemy import event, select, bindparam
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.ext.hybrid import hybrid_method
+from sqlalchemy.sql.expression import FunctionElement
+from sqlalchemy.types import DateTime
+from werkzeug.security import check_password_hash
+from argon2 import PasswordHasher
+from argon2.exceptions import VerificationError, InvalidHashError
+import joblib
 
 db = SQLAlchemy()
 
+# Serialized ML models live on disk (or a mounted object store) and the
+# ml_models table only keeps their location.
+MODEL_STORAGE_DIR = os.getenv('ML_MODEL_DIR', 'ml_models')
+
+# argon2id hasher for passwords; legacy werkzeug hashes are upgraded on login.
+# Cost is tunable per environment, e.g. ARGON2_TIME_COST=1 ARGON2_MEMORY_COST=8
+# ARGON2_PARALLELISM=1 for test runs that create many users. Hashes made with
+# other parameters still verify and are rehashed on the next login.
+ARGON2_PARALLELISM = int(os.getenv('ARGON2_PARALLELISM', 2))
+password_hasher = PasswordHasher(
+    time_cost=int(os.getenv('ARGON2_TIME_COST', 2)),
+    # argon2 needs at least 8 KiB per lane
+    memory_cost=max(int(os.getenv('ARGON2_MEMORY_COST', 65536)), 8 * ARGON2_PARALLELISM),
+    parallelism=ARGON2_PARALLELISM
+)
+
+class utcnow(FunctionElement):
+    """Current UTC time as a naive timestamp, evaluated by the database"""
+    type = DateTime()
+    inherit_cache = True
+
+@compiles(utcnow)
+def compile_utcnow(element, compiler, **kw):
+    return 'CURRENT_TIMESTAMP'  # UTC on SQLite
+
+@compiles(utcnow, 'postgresql')
+def compile_utcnow_postgresql(element, compiler, **kw):
+    return "TIMEZONE('utc', CURRENT_TIMESTAMP)"
+
+# JSON columns are JSONB on PostgreSQL, so the driver hands back parsed values
+JSON_TYPE = db.JSON().with_variant(postgresql.JSONB(), 'postgresql')
+
+# Predefined categories and constants
+EXPENSE_CATEGORIES_LIST = [
+    'Food & Dining',
+    'Transportation',
+    'Shopping',
+    'Entertainment',
+    'Bills & Utilities',
+    'Healthcare',
+    'Travel',
+    'Education',
+    'Personal Care',
+    'Home & Garden',
+    'Gifts & Donations',
+    'Business',
+    'Investment',
+    'Insurance',
+    'Other'
+]
+
+PAYMENT_MODES_LIST = [
+    'cash',
+    'card',
+    'wallet',
+    'bank',
+    'online',
+    'cheque'
+]
+
+BUDGET_PERIODS_LIST = [
+    'daily',
+    'weekly',
+    'monthly',
+    'yearly'
+]
+
+RECOMMENDATION_TYPES_LIST = [
+    'budget_alert',
+    'high_spending_alert',
+    'category_optimization',
+    'spending_pattern',
+    'savings_opportunity',
+    'bill_reminder',
+    'unusual_activity',
+    'budget_suggestion'
+]
+
+# Frozen views of the lists above for O(1) membership checks during validation;
+# the ordered lists are kept for JSON responses.
+EXPENSE_CATEGORIES = frozenset(EXPENSE_CATEGORIES_LIST)
+PAYMENT_MODES = frozenset(PAYMENT_MODES_LIST)
+BUDGET_PERIODS = frozenset(BUDGET_PERIODS_LIST)
+RECOMMENDATION_TYPES = frozenset(RECOMMENDATION_TYPES_LIST)
+
+ML_MODEL_TYPES = [
+    'category_prediction',
+    'anomaly_detection',
+    'spending_forecast',
+    'budget_optimization'
+]
+
+PRIORITY_LEVELS = [
+    'low',
+    'medium',
+    'high',
+    'critical'
+]
+
+# to_dict() methods return datetime values as-is; the API's orjson JSON
+# provider writes them in isoformat() form without a per-field call.
 class User(db.Model):
     __tablename__ = 'users'
     
@@ -13,8 +124,8 @@ class User(db.Model):
     username = db.Column(db.String(50), unique=True, nullable=False, index=True)
     email = db.Column(db.String(255), unique=True, nullable=False, index=True)
     password_hash = db.Column(db.String(255), nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = db.Column(db.DateTime, server_default=utcnow(), nullable=False)
+    updated_at = db.Column(db.DateTime, server_default=utcnow(), onupdate=utcnow())
     
     # User settings
     monthly_budget = db.Column(db.Float, default=0.0)
@@ -30,20 +141,34 @@ class User(db.Model):
     email_verified = db.Column(db.Boolean, default=False)
     last_login = db.Column(db.DateTime)
     
-    # Relationships
-    expenses = db.relationship('Expense', backref='user', lazy='dynamic', cascade='all, delete-orphan')
-    budgets = db.relationship('Budget', backref='user', lazy='dynamic', cascade='all, delete-orphan')
-    ml_models = db.relationship('MLModel', backref='user', lazy='dynamic', cascade='all, delete-orphan')
-    recommendations = db.relationship('Recommendation', backref='user', lazy='dynamic', cascade='all, delete-orphan')
+    # Relationships. Expenses are unbounded and always read with explicit
+    # queries, so implicit loads raise; the database cascades their deletion.
+    # The smaller collections load on access and can be batched per query
+    # with selectinload().
+    expenses = db.relationship('Expense', backref='user', lazy='raise', cascade='all, delete-orphan', passive_deletes=True)
+    budgets = db.relationship('Budget', backref='user', lazy='select', cascade='all, delete-orphan')
+    ml_models = db.relationship('MLModel', backref='user', lazy='select', cascade='all, delete-orphan')
+    recommendations = db.relationship('Recommendation', backref='user', lazy='select', cascade='all, delete-orphan')
 
     def set_password(self, password):
         """Set password hash"""
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
     
     def check_password(self, password):
-        """Check password"""
+        """Check password against an argon2 or legacy werkzeug hash"""
+        if self.password_hash.startswith('$argon2'):
+            try:
+                return password_hasher.verify(self.password_hash, password)
+            except (VerificationError, InvalidHashError):
+                return False
         return check_password_hash(self.password_hash, password)
     
+    def password_needs_rehash(self):
+        """Whether the stored hash is legacy or uses outdated argon2 parameters"""
+        if not self.password_hash.startswith('$argon2'):
+            return True
+        return password_hasher.check_needs_rehash(self.password_hash)
+    
     def to_dict(self):
         """Convert to dictionary"""
         return {
@@ -52,7 +177,7 @@ class User(db.Model):
             'email': self.email,
             'monthly_budget': self.monthly_budget,
             'default_currency': self.default_currency,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'created_at': self.created_at,
             'is_active': self.is_active
         }
     
@@ -63,23 +188,23 @@ class Expense(db.Model):
     __tablename__ = 'expenses'
     
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False, index=True)
     
     # Basic expense information
     title = db.Column(db.String(200), nullable=False)
     amount = db.Column(db.Float, nullable=False)
-    category = db.Column(db.String(50), nullable=False, index=True)
+    category = db.Column(db.Enum(*EXPENSE_CATEGORIES_LIST, name='expense_category'), nullable=False)
     subcategory = db.Column(db.String(50))
     
     # Date and payment information
-    date = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
-    payment_mode = db.Column(db.String(20), nullable=False)  # cash, card, wallet, bank, online
+    date = db.Column(db.DateTime, nullable=False, server_default=utcnow(), index=True)
+    payment_mode = db.Column(db.Enum(*PAYMENT_MODES_LIST, name='payment_mode'), nullable=False)
     
     # Additional details
     description = db.Column(db.Text)
     location = db.Column(db.String(200))
     merchant = db.Column(db.String(100))
-    tags = db.Column(db.String(500))  # JSON string of tags
+    tags = db.Column(JSON_TYPE)  # List of tag strings
     receipt_url = db.Column(db.String(500))
     
     # Currency and exchange
@@ -100,54 +225,83 @@ class Expense(db.Model):
     parent_transaction_id = db.Column(db.Integer, db.ForeignKey('expenses.id'))
     
     # Audit fields
-    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = db.Column(db.DateTime, server_default=utcnow(), nullable=False)
+    updated_at = db.Column(db.DateTime, server_default=utcnow(), onupdate=utcnow())
     
     # Self-referential relationship for recurring transactions
     parent_transaction = db.relationship('Expense', remote_side=[id], backref='recurring_children')
-    
-    def get_tags(self):
-        """Get tags as list"""
-        if self.tags:
-            try:
-                return json.loads(self.tags)
-            except (json.JSONDecodeError, TypeError):
-                return self.tags.split(',') if isinstance(self.tags, str) else []
-        return []
-    
-    def set_tags(self, tags_list):
-        """Set tags from list"""
-        if isinstance(tags_list, list):
-            self.tags = json.dumps(tags_list)
-        elif isinstance(tags_list, str):
-            self.tags = tags_list
-    
+
+    # Composite indexes for per-user date range and category queries; both
+    # cover the aggregate columns so they are index-only scans. The category
+    # index also serves budget spent sums (user, category, date range).
+    __table_args__ = (
+        db.Index(
+            'ix_expense_user_date_covering', user_id, date.desc(),
+            postgresql_include=['category', 'amount', 'payment_mode']
+        ),
+        db.Index(
+            'ix_expense_user_category_date', 'user_id', 'category', 'date',
+            postgresql_include=['amount']
+        ),
+        db.Index('ix_expense_tags', 'tags', postgresql_using='gin'),
+    )
+
     def to_dict(self):
         """Convert to dictionary"""
+        return Expense.row_to_dict(self)
+    
+    @staticmethod
+    def row_to_dict(row):
+        """Convert an Expense or a row selected with EXPENSE_DICT_COLUMNS to dictionary"""
         return {
-            'id': self.id,
-            'title': self.title,
-            'amount': float(self.amount) if self.amount else 0,
-            'category': self.category,
-            'subcategory': self.subcategory,
-            'date': self.date.isoformat() if self.date else None,
-            'paymentMode': self.payment_mode,
-            'description': self.description,
-            'location': self.location,
-            'merchant': self.merchant,
-            'tags': self.get_tags(),
-            'currency': self.currency,
-            'is_predicted_category': self.is_predicted_category,
-            'category_confidence': float(self.category_confidence) if self.category_confidence else None,
-            'is_anomaly': self.is_anomaly,
-            'anomaly_score': float(self.anomaly_score) if self.anomaly_score else None,
-            'is_recurring': self.is_recurring,
-            'created_at': self.created_at.isoformat() if self.created_at else None
+            'id': row.id,
+            'title': row.title,
+            'amount': row.amount or 0.0,
+            'category': row.category,
+            'subcategory': row.subcategory,
+            'date': row.date,
+            'paymentMode': row.payment_mode,
+            'description': row.description,
+            'location': row.location,
+            'merchant': row.merchant,
+            'tags': row.tags or [],
+            'currency': row.currency,
+            'is_predicted_category': row.is_predicted_category,
+            'category_confidence': row.category_confidence,
+            'is_anomaly': row.is_anomaly,
+            'anomaly_score': row.anomaly_score,
+            'is_recurring': row.is_recurring,
+            'created_at': row.created_at
         }
     
     def __repr__(self):
         return f'<Expense {self.title}: ${self.amount}>'
 
+# Columns read by Expense.row_to_dict, for list queries that skip ORM hydration
+EXPENSE_DICT_COLUMNS = (
+    Expense.id, Expense.title, Expense.amount, Expense.category, Expense.subcategory,
+    Expense.date, Expense.payment_mode, Expense.description, Expense.location,
+    Expense.merchant, Expense.tags, Expense.currency, Expense.is_predicted_category,
+    Expense.category_confidence, Expense.is_anomaly, Expense.anomaly_score,
+    Expense.is_recurring, Expense.created_at
+)
+
+# Prebuilt budget spent statements; calls only bind parameters, so the
+# statement and its cache key are not rebuilt per budget
+SPENT_FILTER = (
+    Expense.user_id == bindparam('user_id'),
+    Expense.category == bindparam('category')
+)
+SPENT_AMOUNT_ALL = select(db.func.sum(Expense.amount)).where(*SPENT_FILTER)
+SPENT_AMOUNT_BY_RANGE = SPENT_AMOUNT_ALL.where(
+    Expense.date >= bindparam('start_date'),
+    Expense.date <= bindparam('end_date')
+)
+SPENT_AMOUNT_BY_MONTH = SPENT_AMOUNT_ALL.where(
+    db.extract('month', Expense.date) == bindparam('month'),
+    db.extract('year', Expense.date) == bindparam('year')
+)
+
 class Budget(db.Model):
     __tablename__ = 'budgets'
     
@@ -171,50 +325,103 @@ class Budget(db.Model):
     alert_threshold = db.Column(db.Float, default=0.8)  # Alert when 80% spent
     
     # Audit fields
-    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = db.Column(db.DateTime, server_default=utcnow(), nullable=False)
+    updated_at = db.Column(db.DateTime, server_default=utcnow(), onupdate=utcnow())
     
     # Unique constraint
     __table_args__ = (
         db.UniqueConstraint('user_id', 'category', 'month', 'year', name='unique_user_category_period'),
+        db.Index('ix_budget_user_active', 'user_id', postgresql_where=db.text('is_active')),
     )
     
-    def get_spent_amount(self):
-        """Calculate spent amount for this budget period"""
-        query = Expense.query.filter(
+    def spent_conditions(self):
+        """Filter conditions selecting the expenses counted against this budget"""
+        conditions = [
             Expense.user_id == self.user_id,
             Expense.category == self.category
-        )
+        ]
         
         if self.start_date and self.end_date:
-            query = query.filter(
+            conditions += [
                 Expense.date >= self.start_date,
                 Expense.date <= self.end_date
-            )
+            ]
         elif self.month and self.year:
-            query = query.filter(
+            conditions += [
                 db.extract('month', Expense.date) == self.month,
                 db.extract('year', Expense.date) == self.year
-            )
+            ]
+        
+        return conditions
+    
+    def get_spent_amount(self):
+        """Calculate spent amount for this budget period.
+
+        The result is kept on the instance until the session expires it, so
+        the usage/alert helpers reuse it within a request.
+        """
+        spent = self.__dict__.get('_spent_amount')
+        if spent is not None:
+            return spent
+        if self.category not in EXPENSE_CATEGORIES:
+            return 0.0  # Expense.category cannot hold it
         
-        return query.with_entities(db.func.sum(Expense.amount)).scalar() or 0.0
+        params = {'user_id': self.user_id, 'category': self.category}
+        if self.start_date and self.end_date:
+            statement = SPENT_AMOUNT_BY_RANGE
+            params.update(start_date=self.start_date, end_date=self.end_date)
+        elif self.month and self.year:
+            statement = SPENT_AMOUNT_BY_MONTH
+            params.update(month=self.month, year=self.year)
+        else:
+            statement = SPENT_AMOUNT_ALL
+        spent = db.session.execute(statement, params).scalar() or 0.0
+        self._spent_amount = spent
+        return spent
+    
+    @staticmethod
+    def populate_spent_amounts(budgets):
+        """Load spent amounts for many budgets with one query.
+
+        Each budget gets its own conditional SUM column; get_spent_amount and
+        to_dict then use the loaded value instead of querying per budget.
+        """
+        for budget in budgets:
+            budget._spent_amount = None if budget.category in EXPENSE_CATEGORIES else 0.0
+        budgets = [budget for budget in budgets if budget._spent_amount is None]
+        if not budgets:
+            return
+        
+        sums = [
+            db.func.coalesce(db.func.sum(db.case((db.and_(*budget.spent_conditions()), Expense.amount))), 0.0)
+            for budget in budgets
+        ]
+        totals = db.session.query(*sums).filter(
+            Expense.user_id.in_({budget.user_id for budget in budgets}),
+            Expense.category.in_({budget.category for budget in budgets})
+        ).one()
+        
+        for budget, total in zip(budgets, totals):
+            budget._spent_amount = float(total)
     
-    def get_remaining_amount(self):
+    def get_remaining_amount(self, spent=None):
         """Get remaining budget amount"""
-        return max(0, self.budget_amount - self.get_spent_amount())
+        spent = self.get_spent_amount() if spent is None else spent
+        return max(0.0, self.budget_amount - spent)
     
-    def get_usage_percentage(self):
+    def get_usage_percentage(self, spent=None):
         """Get budget usage percentage"""
-        spent = self.get_spent_amount()
-        return (spent / self.budget_amount * 100) if self.budget_amount > 0 else 0
+        spent = self.get_spent_amount() if spent is None else spent
+        return (spent / self.budget_amount * 100) if self.budget_amount > 0 else 0.0
     
-    def is_over_budget(self):
+    def is_over_budget(self, spent=None):
         """Check if over budget"""
-        return self.get_spent_amount() > self.budget_amount
+        spent = self.get_spent_amount() if spent is None else spent
+        return spent > self.budget_amount
     
-    def should_alert(self):
+    def should_alert(self, spent=None):
         """Check if should send alert"""
-        return self.get_usage_percentage() >= (self.alert_threshold * 100)
+        return self.get_usage_percentage(spent) >= (self.alert_threshold * 100)
     
     def to_dict(self):
         """Convert to dictionary"""
@@ -223,22 +430,27 @@ class Budget(db.Model):
             'id': self.id,
             'name': self.name,
             'category': self.category,
-            'budget_amount': float(self.budget_amount),
-            'spent_amount': float(spent_amount),
-            'remaining_amount': float(self.get_remaining_amount()),
-            'usage_percentage': float(self.get_usage_percentage()),
+            'budget_amount': self.budget_amount,
+            'spent_amount': spent_amount,
+            'remaining_amount': self.get_remaining_amount(spent_amount),
+            'usage_percentage': self.get_usage_percentage(spent_amount),
             'period': self.period,
             'month': self.month,
             'year': self.year,
             'is_active': self.is_active,
-            'is_over_budget': self.is_over_budget(),
-            'should_alert': self.should_alert(),
-            'created_at': self.created_at.isoformat() if self.created_at else None
+            'is_over_budget': self.is_over_budget(spent_amount),
+            'should_alert': self.should_alert(spent_amount),
+            'created_at': self.created_at
         }
     
     def __repr__(self):
         return f'<Budget {self.name}: ${self.budget_amount}>'
 
+@event.listens_for(Budget, 'expire')
+def forget_spent_amount(target, attrs):
+    """Drop the per-instance spent total when the session expires the budget"""
+    target.__dict__.pop('_spent_amount', None)
+
 class MLModel(db.Model):
     __tablename__ = 'ml_models'
     
@@ -251,14 +463,14 @@ class MLModel(db.Model):
     model_version = db.Column(db.String(20), default='1.0')
     
     # Model data and metadata
-    model_data = db.Column(db.LargeBinary)  # Serialized model
-    model_params = db.Column(db.Text)  # JSON string of model parameters
-    feature_names = db.Column(db.Text)  # JSON string of feature names
+    model_uri = db.Column(db.String(500))  # Location of the serialized model
+    model_params = db.Column(JSON_TYPE)  # Dict of model parameters
+    feature_names = db.Column(JSON_TYPE)  # List of feature names
     
     # Training information
     training_accuracy = db.Column(db.Float)
     training_samples = db.Column(db.Integer)
-    training_date = db.Column(db.DateTime, default=datetime.utcnow)
+    training_date = db.Column(db.DateTime, server_default=utcnow())
     training_duration = db.Column(db.Float)  # in seconds
     
     # Model status
@@ -272,41 +484,37 @@ class MLModel(db.Model):
     f1_score = db.Column(db.Float)
     
     # Audit fields
-    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = db.Column(db.DateTime, server_default=utcnow(), nullable=False)
+    updated_at = db.Column(db.DateTime, server_default=utcnow(), onupdate=utcnow())
     
-    def get_model_params(self):
-        """Get model parameters as dict"""
-        if self.model_params:
-            try:
-                return json.loads(self.model_params)
-            except (json.JSONDecodeError, TypeError):
-                return {}
-        return {}
-    
-    def set_model_params(self, params_dict):
-        """Set model parameters from dict"""
-        if isinstance(params_dict, dict):
-            self.model_params = json.dumps(params_dict)
-    
-    def get_feature_names(self):
-        """Get feature names as list"""
-        if self.feature_names:
-            try:
-                return json.loads(self.feature_names)
-            except (json.JSONDecodeError, TypeError):
-                return []
-        return []
-    
-    def set_feature_names(self, features_list):
-        """Set feature names from list"""
-        if isinstance(features_list, list):
-            self.feature_names = json.dumps(features_list)
+    def save_model(self, model):
+        """Serialize a model to storage and record its location
+
+        Files are written uncompressed so load_model() can memory-map the
+        numpy arrays inside them.
+        """
+        directory = os.path.join(MODEL_STORAGE_DIR, str(self.user_id))
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f'{self.model_type}_{uuid.uuid4().hex}.joblib')
+        tmp_path = f'{path}.tmp'
+        joblib.dump(model, tmp_path)
+        os.replace(tmp_path, path)
+        self.model_uri = path
+    
+    def load_model(self):
+        """Load the stored model, or None if it has not been saved
+
+        Arrays come back as read-only memory maps, so processes loading the
+        same model share its pages through the OS cache.
+        """
+        if not self.model_uri:
+            return None
+        return joblib.load(self.model_uri, mmap_mode='r')
     
     def increment_usage(self):
         """Increment usage count and update last used"""
         self.usage_count = (self.usage_count or 0) + 1
-        self.last_used = datetime.utcnow()
+        self.last_used = utcnow()
     
     def to_dict(self):
         """Convert to dictionary"""
@@ -315,15 +523,15 @@ class MLModel(db.Model):
             'model_type': self.model_type,
             'model_name': self.model_name,
             'model_version': self.model_version,
-            'training_accuracy': float(self.training_accuracy) if self.training_accuracy else None,
+            'training_accuracy': self.training_accuracy,
             'training_samples': self.training_samples,
-            'training_date': self.training_date.isoformat() if self.training_date else None,
+            'training_date': self.training_date,
             'is_active': self.is_active,
             'usage_count': self.usage_count,
-            'precision_score': float(self.precision_score) if self.precision_score else None,
-            'recall_score': float(self.recall_score) if self.recall_score else None,
-            'f1_score': float(self.f1_score) if self.f1_score else None,
-            'created_at': self.created_at.isoformat() if self.created_at else None
+            'precision_score': self.precision_score,
+            'recall_score': self.recall_score,
+            'f1_score': self.f1_score,
+            'created_at': self.created_at
         }
     
     def __repr__(self):
@@ -338,7 +546,7 @@ class Analytics(db.Model):
     # Analysis information
     analysis_type = db.Column(db.String(50), nullable=False, index=True)  # spending_trends, category_analysis, forecasting
     analysis_name = db.Column(db.String(100))
-    analysis_data = db.Column(db.Text)  # JSON string of analysis results
+    analysis_data = db.Column(JSON_TYPE)  # Dict of analysis results
     
     # Time period
     period_start = db.Column(db.DateTime)
@@ -354,22 +562,8 @@ class Analytics(db.Model):
     is_current = db.Column(db.Boolean, default=True)
     
     # Audit fields
-    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
-    
-    def get_analysis_data(self):
-        """Get analysis data as dict"""
-        if self.analysis_data:
-            try:
-                return json.loads(self.analysis_data)
-            except (json.JSONDecodeError, TypeError):
-                return {}
-        return {}
-    
-    def set_analysis_data(self, data_dict):
-        """Set analysis data from dict"""
-        if isinstance(data_dict, dict):
-            self.analysis_data = json.dumps(data_dict)
+    created_at = db.Column(db.DateTime, server_default=utcnow(), nullable=False)
+    updated_at = db.Column(db.DateTime, server_default=utcnow(), onupdate=utcnow())
     
     def to_dict(self):
         """Convert to dictionary"""
@@ -377,15 +571,15 @@ class Analytics(db.Model):
             'id': self.id,
             'analysis_type': self.analysis_type,
             'analysis_name': self.analysis_name,
-            'analysis_data': self.get_analysis_data(),
-            'period_start': self.period_start.isoformat() if self.period_start else None,
-            'period_end': self.period_end.isoformat() if self.period_end else None,
+            'analysis_data': self.analysis_data or {},
+            'period_start': self.period_start,
+            'period_end': self.period_end,
             'month': self.month,
             'year': self.year,
             'data_points_count': self.data_points_count,
-            'confidence_score': float(self.confidence_score) if self.confidence_score else None,
+            'confidence_score': self.confidence_score,
             'is_current': self.is_current,
-            'created_at': self.created_at.isoformat() if self.created_at else None
+            'created_at': self.created_at
         }
     
     def __repr__(self):
@@ -409,7 +603,7 @@ class Recommendation(db.Model):
     
     # Action information
     action_type = db.Column(db.String(50))  # alert, suggestion, warning
-    action_data = db.Column(db.Text)  # JSON string of action-specific data
+    action_data = db.Column(JSON_TYPE)  # Dict of action-specific data
     
     # Status
     is_read = db.Column(db.Boolean, default=False)
@@ -423,41 +617,33 @@ class Recommendation(db.Model):
     confidence_score = db.Column(db.Float)
     
     # Audit fields
-    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    created_at = db.Column(db.DateTime, server_default=utcnow(), nullable=False)
     read_at = db.Column(db.DateTime)
     dismissed_at = db.Column(db.DateTime)
     
-    def get_action_data(self):
-        """Get action data as dict"""
-        if self.action_data:
-            try:
-                return json.loads(self.action_data)
-            except (json.JSONDecodeError, TypeError):
-                return {}
-        return {}
-    
-    def set_action_data(self, data_dict):
-        """Set action data from dict"""
-        if isinstance(data_dict, dict):
-            self.action_data = json.dumps(data_dict)
-    
     def mark_as_read(self):
         """Mark recommendation as read"""
         self.is_read = True
-        self.read_at = datetime.utcnow()
+        self.read_at = utcnow()
     
     def dismiss(self):
         """Dismiss recommendation"""
         self.is_dismissed = True
-        self.dismissed_at = datetime.utcnow()
+        self.dismissed_at = utcnow()
     
-    def is_expired(self):
-        """Check if recommendation is expired"""
+    @hybrid_method
+    def is_expired(self, now=None):
+        """Check if recommendation is expired; pass now to share one clock across a batch"""
         if self.expires_at:
-            return datetime.utcnow() > self.expires_at
+            return (datetime.utcnow() if now is None else now) > self.expires_at
         return False
     
-    def to_dict(self):
+    @is_expired.expression
+    def is_expired(cls, now=None):
+        """SQL form, e.g. select(Recommendation, Recommendation.is_expired())"""
+        return db.and_(cls.expires_at.isnot(None), cls.expires_at < (utcnow() if now is None else now))
+    
+    def to_dict(self, now=None):
         """Convert to dictionary"""
         return {
             'id': self.id,
@@ -465,82 +651,22 @@ class Recommendation(db.Model):
             'title': self.title,
             'message': self.message,
             'category': self.category,
-            'amount': float(self.amount) if self.amount else None,
+            'amount': self.amount,
             'priority': self.priority,
             'action_type': self.action_type,
-            'action_data': self.get_action_data(),
+            'action_data': self.action_data or {},
             'is_read': self.is_read,
             'is_dismissed': self.is_dismissed,
             'is_acted_upon': self.is_acted_upon,
-            'confidence_score': float(self.confidence_score) if self.confidence_score else None,
-            'expires_at': self.expires_at.isoformat() if self.expires_at else None,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'is_expired': self.is_expired()
+            'confidence_score': self.confidence_score,
+            'expires_at': self.expires_at,
+            'created_at': self.created_at,
+            'is_expired': self.is_expired(now)
         }
     
     def __repr__(self):
         return f'<Recommendation {self.title} for User {self.user_id}>'
 
-# Predefined categories and constants
-EXPENSE_CATEGORIES = [
-    'Food & Dining',
-    'Transportation',
-    'Shopping',
-    'Entertainment',
-    'Bills & Utilities',
-    'Healthcare',
-    'Travel',
-    'Education',
-    'Personal Care',
-    'Home & Garden',
-    'Gifts & Donations',
-    'Business',
-    'Investment',
-    'Insurance',
-    'Other'
-]
-
-PAYMENT_MODES = [
-    'cash',
-    'card',
-    'wallet',
-    'bank',
-    'online',
-    'cheque'
-]
-
-BUDGET_PERIODS = [
-    'daily',
-    'weekly',
-    'monthly',
-    'yearly'
-]
-
-RECOMMENDATION_TYPES = [
-    'budget_alert',
-    'high_spending_alert',
-    'category_optimization',
-    'spending_pattern',
-    'savings_opportunity',
-    'bill_reminder',
-    'unusual_activity',
-    'budget_suggestion'
-]
-
-ML_MODEL_TYPES = [
-    'category_prediction',
-    'anomaly_detection',
-    'spending_forecast',
-    'budget_optimization'
-]
-
-PRIORITY_LEVELS = [
-    'low',
-    'medium',
-    'high',
-    'critical'
-]
-
 # Database helper functions
 def create_tables(app):
     """Create all database tables"""
@@ -552,24 +678,47 @@ def drop_tables(app):
     with app.app_context():
         db.drop_all()
 
+# Demo accounts created by init_db
+SAMPLE_USERS = [
+    {
+        'username': 'demo_user',
+        'email': 'demo@example.com',
+        'monthly_budget': 3000.0,
+        'password': 'demo_password'
+    }
+]
+
+# Dialect INSERT constructs that support ON CONFLICT DO NOTHING
+CONFLICT_INSERTS = {
+    'postgresql': postgresql.insert,
+    'sqlite': sqlite.insert
+}
+
 def init_db(app):
-    """Initialize database with sample data"""
+    """Initialize database with sample data
+
+    All sample users go in with one INSERT ... ON CONFLICT DO NOTHING, so
+    running it again leaves existing rows alone. Returns the usernames that
+    were created.
+    """
     with app.app_context():
         db.create_all()
         
-        # Check if we already have users
-        if User.query.count() == 0:
-            # Create sample user
-            sample_user = User(
-                username='demo_user',
-                email='demo@example.com',
-                monthly_budget=3000.0
-            )
-            sample_user.set_password('demo_password')
-            db.session.add(sample_user)
-            db.session.commit()
-            
-            print(f"Created sample user: {sample_user.username}")
-            return sample_user
+        rows = [
+            {
+                'username': user['username'],
+                'email': user['email'],
+                'monthly_budget': user['monthly_budget'],
+                'password_hash': password_hasher.hash(user['password'])
+            }
+            for user in SAMPLE_USERS
+        ]
+        statement = CONFLICT_INSERTS[db.engine.dialect.name](User).values(rows)
+        created = db.session.execute(
+            statement.on_conflict_do_nothing().returning(User.username)
+        ).scalars().all()
+        db.session.commit()
         
-        return None
\ No newline at end of file
+        for username in created:
+            print(f"Created sample user: {username}")
+        return created